@@ -1,8 +1,17 @@
+import asyncio
+import hashlib
+import json
 import os
-import re
+import queue
+import string
+import threading
+import time
+from collections import deque
 from datetime import datetime
+import httpx
+import tiktoken
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import streamlit as st
 
 # -----------------------------
@@ -19,7 +28,10 @@ st.set_page_config(
     }
 )
 
-st.markdown("""
+# Static HTML lives in module constants so reruns reuse the same string
+# objects; note Streamlit drops elements that aren't re-emitted on a
+# rerun, so these still have to be injected every run.
+_CSS = """
 <style>
 .block-container { padding-top: 2rem; }
 .stButton>button { border-radius: 8px; padding: 0.6rem 1rem; font-weight: 600; }
@@ -31,7 +43,25 @@ footer { visibility: hidden; }
 .footer-btn { border: 1px solid #e5e7eb; border-radius: 8px; padding: 0.4rem 0.8rem; text-decoration: none; color: inherit; font-weight: 600; }
 .footer-note { color: #6b7280; font-size: 0.9rem; }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+_FOOTER_HTML = """
+<div class="footer-bar">
+  <a class="footer-btn" href="#" target="_self">Home</a>
+  <a class="footer-btn" href="#" target="_self">Docs</a>
+  <a class="footer-btn" href="#" target="_self">Contact</a>
+  <span class="footer-note">Local app. When you’re ready, we’ll deploy to your domain: spyceofficial.com</span>
+</div>
+"""
+
+def _inject_html(html: str) -> None:
+    # st.html (Streamlit >= 1.33) skips the markdown parser entirely.
+    if hasattr(st, "html"):
+        st.html(html)
+    else:
+        st.markdown(html, unsafe_allow_html=True)
+
+_inject_html(_CSS)
 
 # -----------------------------
 # Environment & client
@@ -42,46 +72,453 @@ if not OPENAI_API_KEY:
     st.error("Missing OPENAI_API_KEY. Add it to your .env file.")
     st.stop()
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Cap concurrent requests so a fan-out can't blow through RPM limits.
+MAX_PARALLEL_REQUESTS = 10
+
+# Local traffic shaping, tuned to the account's limits via env. Staying
+# under the API's RPM/TPM avoids the 429 retry-backoff tail (often
+# several seconds) that otherwise dominates latency under bursty use.
+RPM_LIMIT = int(os.getenv("OPENAI_RPM", "60"))
+TPM_LIMIT = int(os.getenv("OPENAI_TPM", "90000"))
+
+@st.cache_resource
+def _get_clients():
+    """Build the OpenAI clients once per process, not per rerun.
+
+    An explicit HTTP/2 transport with keep-alive pooling avoids paying
+    a fresh TLS handshake (~100-300 ms) after idle and lets concurrent
+    fan-out calls multiplex on pooled connections instead of opening
+    new sockets.
+    """
+    limits = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+    timeout = httpx.Timeout(60.0, connect=10.0)
+    return (
+        OpenAI(api_key=OPENAI_API_KEY,
+               http_client=httpx.Client(http2=True, limits=limits, timeout=timeout)),
+        AsyncOpenAI(api_key=OPENAI_API_KEY,
+                    http_client=httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)),
+    )
+
+client, aclient = _get_clients()
 
 BASE_DIR = os.path.abspath(".")
 PROJECTS_DIR = os.path.join(BASE_DIR, "projects")
 os.makedirs(PROJECTS_DIR, exist_ok=True)
 
+# Quick templates — built once at import instead of a fresh dict per rerun.
+_TEMPLATES = {
+    "Python: Hello World CLI": "Build a Python CLI that prints 'Hello, SpyceOfficial!'",
+    "Python: To-do list (CLI)": "Build a Python CLI to add/list/remove tasks and save them to tasks.json.",
+    "Python: Login system (JSON users)": "Build a Python CLI login system with register/login/logout, storing users in users.json (username + hashed password).",
+    "Streamlit: Simple dashboard": "Build a Streamlit app with a sidebar, a main chart using random data, and a table view.",
+    "Flask: Minimal API with /hello": "Build a Flask app with a /hello endpoint returning JSON {message: 'Hello from SpyceOfficial'}."
+}
+_TEMPLATE_NAMES = ("— None —", *_TEMPLATES)
+
 # -----------------------------
 # Helpers
 # -----------------------------
+# Translation table mapping every disallowed ASCII code point to "_";
+# str.translate is several times faster than re.sub on short names.
+_ALLOWED_NAME_CHARS = set(string.ascii_letters + string.digits + "_-.")
+_SANITIZE_TABLE = {ord(c): "_" for c in map(chr, range(128)) if c not in _ALLOWED_NAME_CHARS}
+
 def sanitize_filename(name: str) -> str:
     name = (name or "").strip()
     if not name:
         return "app.py"
-    name = re.sub(r"[^a-zA-Z0-9_\-\.]", "_", name)
+    # Fold non-ASCII to ASCII first so the table covers every input.
+    name = name.encode("ascii", "replace").decode("ascii").translate(_SANITIZE_TABLE)
     if not name.endswith(".py"):
         name += ".py"
     return name
 
-def save_text(content: str, filename: str) -> str:
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+def save_text(content: str, filename: str, now=None) -> str:
+    # Callers that also record history pass `now` so the filename stamp
+    # and the history entry agree exactly.
+    now = now or datetime.now()
+    ts = now.strftime("%Y%m%d_%H%M%S")
     safe = sanitize_filename(filename)
     path = os.path.join(PROJECTS_DIR, f"{ts}_{safe}")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    # Binary mode with a large buffer: one encode + few big writes
+    # instead of the text layer's incremental encoding, which matters
+    # for multi-megabyte outputs like combined voice transcripts.
+    # Write to a temp name and rename atomically so a crash mid-write
+    # never leaves a half-written file in /projects. No fsync: the
+    # rename protects against app crashes, which is the threat model
+    # here, not power loss.
+    tmp = path + ".tmp"
+    with open(tmp, "wb", buffering=512 * 1024) as f:
+        f.write(content.encode("utf-8"))
+    os.replace(tmp, path)
     return path
 
-def ask_model(messages, temperature=0.2):
+def _strip_edges(text):
+    """Strip whitespace only when an end actually has some.
+
+    str.strip() always allocates a copy; for multi-kilobyte model
+    outputs that's a second full string per call.
+    """
+    if not text:
+        return ""
+    if text[0].isspace() or text[-1].isspace():
+        return text.strip()
+    return text
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until capacity refills."""
+
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # Clamp so a single oversized request can't block forever.
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+@st.cache_resource
+def _rate_limiters():
+    """One (requests, tokens) bucket pair shared across all sessions."""
+    return (
+        TokenBucket(RPM_LIMIT / 60.0, RPM_LIMIT),
+        TokenBucket(TPM_LIMIT / 60.0, TPM_LIMIT),
+    )
+
+def _throttle(messages, expected_output=500):
+    """Block until the request fits under the local RPM and TPM budget.
+
+    Input tokens are counted with tiktoken; output is estimated, which
+    only has to be roughly right for shaping to work.
+    """
+    rpm_bucket, tpm_bucket = _rate_limiters()
+    rpm_bucket.acquire(1)
+    tpm_bucket.acquire(sum(count_tokens(m["content"]) for m in messages) + expected_output)
+
+COMPLETION_CACHE_TTL = 3600
+
+@st.cache_resource
+def _completion_cache():
+    """Process-wide memo for finished completions.
+
+    Cannot be st.cache_data: streaming renders into the caller's
+    placeholder, and Streamlit's cached-element replay raises
+    CacheReplayClosureError for elements written to a layout block
+    created outside the cached function. A plain dict of
+    (model, msgs_json, temperature) -> (monotonic time, text) keeps the
+    UI writes out of the cache machinery.
+    """
+    return {}
+
+def ask_model(messages, temperature=0.2, placeholder=None, language="python"):
+    """Stream a chat completion, progressively rendering into `placeholder`.
+
+    If `placeholder` is a st.empty() slot, partial output appears as soon as
+    the first token arrives. Pass language=None to render as markdown
+    instead of a code block. Repeated identical prompts within an hour are
+    served from cache with no API call. Returns the full accumulated text.
+    """
     try:
+        key = ("gpt-3.5-turbo", json.dumps(messages, sort_keys=True), temperature)
+        cache = _completion_cache()
+        now = time.monotonic()
+        hit = cache.get(key)
+        if hit is not None and now - hit[0] < COMPLETION_CACHE_TTL:
+            return hit[1]
+
+        _throttle(messages)
         resp = client.chat.completions.create(
+            model=key[0],
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+        acc = ""
+        for chunk in resp:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                acc += delta
+                if placeholder is not None:
+                    if language is None:
+                        placeholder.markdown(acc)
+                    else:
+                        placeholder.code(acc, language=language)
+        result = _strip_edges(acc)
+
+        for stale in [k for k, (t, _) in cache.items() if now - t >= COMPLETION_CACHE_TTL]:
+            del cache[stale]
+        cache[key] = (now, result)
+        return result
+    except Exception as e:
+        return f"⚠️ Error: {e}"
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_transcribe(digest: str, _file) -> str:
+    """Transcription memoized on the audio's SHA-256 digest.
+
+    Re-uploading the same clip skips the transcription round trip
+    entirely. `_file` is a (name, fileobj, mime) tuple sent straight to
+    the API; response_format="text" returns the transcript as a plain
+    str, skipping the JSON envelope.
+    """
+    return _strip_edges(client.audio.transcriptions.create(
+        model="gpt-4o-mini-transcribe",
+        file=_file,
+        response_format="text"
+    ))
+
+async def ask_async(messages, temperature=0.2, retries=3):
+    """Async chat completion with exponential backoff on 429/5xx."""
+    for attempt in range(retries + 1):
+        try:
+            # Blocking bucket waits happen off the event loop so other
+            # in-flight calls keep streaming.
+            await asyncio.to_thread(_throttle, messages)
+            r = await aclient.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                temperature=temperature,
+            )
+            return _strip_edges(r.choices[0].message.content)
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            retryable = status == 429 or (status is not None and status >= 500)
+            if attempt < retries and retryable:
+                await asyncio.sleep(2 ** attempt)
+                continue
+            return f"⚠️ Error: {e}"
+
+async def _gather(batches, temperature):
+    sem = asyncio.Semaphore(MAX_PARALLEL_REQUESTS)
+
+    async def one(messages):
+        async with sem:
+            return await ask_async(messages, temperature)
+
+    return await asyncio.gather(*(one(m) for m in batches))
+
+def ask_many(batches, temperature=0.2):
+    """Run several chat completions concurrently.
+
+    Takes a list of `messages` lists and returns answers in the same
+    order. Wall time is roughly the slowest single call instead of the
+    sum, up to MAX_PARALLEL_REQUESTS in flight at once.
+    """
+    return asyncio.run(_gather(batches, temperature))
+
+def ask_model_nvariants(messages, n=3, temperature=0.7):
+    """Sample n completions of the same prompt in one request.
+
+    Uses the API's `n` parameter, so the shared input tokens are sent
+    (and billed) once and only one HTTP round trip is paid for all n
+    variants — this trades RPM pressure for TPM. Returns a list of n
+    strings.
+    """
+    try:
+        _throttle(messages, expected_output=500 * n)
+        r = client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=messages,
             temperature=temperature,
+            n=n,
         )
-        return resp.choices[0].message.content.strip()
+        return [_strip_edges(c.message.content) for c in r.choices]
     except Exception as e:
-        return f"⚠️ Error: {str(e)}"
+        return [f"⚠️ Error: {e}"]
+
+# Inputs above this size get split, transformed per chunk in parallel,
+# and merged — a single oversized call is slower and may blow context.
+CHUNK_TOKEN_THRESHOLD = 3000
+CHUNK_TOKENS = 2500
+CHUNK_OVERLAP = 200
+
+@st.cache_resource
+def _encoding():
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text))
+
+def split_by_tokens(text, chunk_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping token windows, in document order."""
+    enc = _encoding()
+    tokens = enc.encode(text)
+    chunks = []
+    step = chunk_tokens - overlap
+    for start in range(0, len(tokens), step):
+        chunks.append(enc.decode(tokens[start:start + chunk_tokens]))
+        if start + chunk_tokens >= len(tokens):
+            break
+    return chunks
+
+def run_llm_pipeline(mode, system_prompt, user_content, history_prompt, filename,
+                     language="python", temperature=0.2, result_label="📝 Result",
+                     download_label="Download file", save_optional=False,
+                     chunk_blob=None, chunk_user_fn=None):
+    """Shared pipeline behind the four text modes.
+
+    Streams the completion into a placeholder, saves the result to
+    /projects, offers a download, and appends to history — implemented
+    once so streaming/caching/rate-limit work applies to every tab.
+
+    If `chunk_blob` (the pasted text) exceeds CHUNK_TOKEN_THRESHOLD
+    tokens, it is split into overlapping windows that are transformed
+    concurrently via ask_many — `chunk_user_fn` builds the user message
+    for one chunk — then merged with a final reduce call. Chunk order
+    is preserved by index throughout.
+    """
+    st.subheader(result_label)
+    out = st.empty()
+    if chunk_blob is not None and chunk_user_fn is not None and count_tokens(chunk_blob) > CHUNK_TOKEN_THRESHOLD:
+        chunks = split_by_tokens(chunk_blob)
+        st.caption(f"Large input — transforming {len(chunks)} chunks in parallel, then merging.")
+        batches = [
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": chunk_user_fn(chunk)}
+            ]
+            for chunk in chunks
+        ]
+        partials = ask_many(batches, temperature=temperature)
+        merge_messages = [
+            {"role": "system", "content": "Merge these updated chunks into one coherent result. Keep them in the given order and return only the merged result."},
+            {"role": "user", "content": "\n\n".join(partials)}
+        ]
+        result = ask_model(merge_messages, temperature=temperature, placeholder=out, language=language)
+    else:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+        result = ask_model(messages, temperature=temperature, placeholder=out, language=language)
+    if language is None:
+        out.markdown(result)
+    else:
+        out.code(result, language=language)
+
+    if save_optional and not filename.strip():
+        return
+
+    try:
+        now = datetime.now()
+        path = save_text(result, filename, now)
+        st.success(f"✅ Saved to {path}")
+        st.download_button(download_label, result, file_name=os.path.basename(path))
+        append_history({
+            "mode": mode,
+            "prompt": history_prompt,
+            "filename": filename,
+            "path": path,
+            "time": now.strftime("%Y-%m-%d %H:%M:%S")
+        })
+    except Exception as e:
+        st.error(f"❌ Failed to save file: {e}")
+
+def submit_batch(messages_list, custom_ids, model="gpt-3.5-turbo", temperature=0.2):
+    """Submit requests through the 24-hour Batch API.
+
+    Batched requests cost half the synchronous price and draw on a
+    separate rate-limit pool — right for bulk jobs that don't need an
+    instant answer. Writes the requests as JSONL, uploads via the Files
+    API, and returns the batch id for later polling.
+    """
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    jsonl_path = os.path.join(PROJECTS_DIR, f"batch_{ts}.jsonl")
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for custom_id, messages in zip(custom_ids, messages_list):
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"model": model, "messages": messages, "temperature": temperature},
+            }) + "\n")
+
+    with open(jsonl_path, "rb") as f:
+        upload = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+@st.cache_data(show_spinner=False)
+def _render_history_block(cache_key, _entries) -> str:
+    """Build the sidebar history markdown as one string.
+
+    `cache_key` is (length, last timestamp), so the block is only
+    rebuilt when history actually changes — not on every rerun.
+    """
+    lines = []
+    for item in reversed(_entries):
+        name = os.path.basename(item.get("path", "")) if item.get("path") else "—"
+        lines.append(
+            f"- **Mode:** {item['mode']}  \n"
+            f"  **Prompt:** {item['prompt'][:60]}{'...' if len(item['prompt'])>60 else ''}  \n"
+            f"  **File:** `{name}` — {item['time']}"
+        )
+    return "\n".join(lines)
+
+HISTORY_PATH = os.path.join(PROJECTS_DIR, "_history.jsonl")
+
+@st.cache_resource
+def _history_queue():
+    """Start the append-only history writer thread (once per process).
+
+    Entries go through a queue so the hot path is a sub-microsecond
+    put(); the thread appends one JSONL line per entry off the rerun.
+    """
+    q = queue.Queue()
+
+    def _writer():
+        with open(HISTORY_PATH, "a", buffering=64 * 1024, encoding="utf-8") as f:
+            while True:
+                item = q.get()
+                f.write(json.dumps(item) + "\n")
+                f.flush()
+
+    threading.Thread(target=_writer, daemon=True, name="history-writer").start()
+    return q
+
+def append_history(item):
+    """Record an entry in the session list and queue the disk append."""
+    st.session_state.history.append(item)
+    _history_queue().put(item)
+
+def _load_recent_history(limit=20):
+    """Read the last `limit` history entries; O(1) memory via deque."""
+    try:
+        with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+            recent = deque(f, maxlen=limit)
+    except OSError:
+        return []
+    entries = []
+    for line in recent:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
 
 def init_state():
     if "history" not in st.session_state:
-        st.session_state.history = []  # {mode, prompt, filename, path, time}
+        # {mode, prompt, filename, path, time} — seeded from disk so
+        # history survives page reloads.
+        st.session_state.history = _load_recent_history()
+    if "batches" not in st.session_state:
+        st.session_state.batches = []  # {id, status, time, saved}
 
 init_state()
 
@@ -94,41 +531,22 @@ with st.sidebar:
     st.divider()
 
     st.markdown("### 🎯 Quick templates")
-    template = st.selectbox(
-        "Pick a template to auto-fill the prompt",
-        [
-            "— None —",
-            "Python: Hello World CLI",
-            "Python: To-do list (CLI)",
-            "Python: Login system (JSON users)",
-            "Streamlit: Simple dashboard",
-            "Flask: Minimal API with /hello",
-        ]
-    )
-
-    def template_text(name: str) -> str:
-        mapping = {
-            "Python: Hello World CLI": "Build a Python CLI that prints 'Hello, SpyceOfficial!'",
-            "Python: To-do list (CLI)": "Build a Python CLI to add/list/remove tasks and save them to tasks.json.",
-            "Python: Login system (JSON users)": "Build a Python CLI login system with register/login/logout, storing users in users.json (username + hashed password).",
-            "Streamlit: Simple dashboard": "Build a Streamlit app with a sidebar, a main chart using random data, and a table view.",
-            "Flask: Minimal API with /hello": "Build a Flask app with a /hello endpoint returning JSON {message: 'Hello from SpyceOfficial'}."
-        }
-        return mapping.get(name, "")
+    template = st.selectbox("Pick a template to auto-fill the prompt", _TEMPLATE_NAMES)
 
     if template != "— None —":
         st.info("Template selected. It will prefill the prompt in Build mode.")
 
     st.divider()
     st.markdown("### 📜 History")
-    if st.session_state.history:
-        for item in reversed(st.session_state.history):
-            name = os.path.basename(item.get("path", "")) if item.get("path") else "—"
-            st.markdown(
-                f"- **Mode:** {item['mode']}  \n"
-                f"  **Prompt:** {item['prompt'][:60]}{'...' if len(item['prompt'])>60 else ''}  \n"
-                f"  **File:** `{name}` — {item['time']}"
-            )
+    history = st.session_state.history
+    if history:
+        # One markdown widget for the last 20 entries instead of one per
+        # entry; older items live behind an expander.
+        cache_key = (len(history), history[-1]["time"])
+        st.markdown(_render_history_block(cache_key, history[-20:]))
+        if len(history) > 20:
+            with st.expander(f"Show all ({len(history)})"):
+                st.markdown(_render_history_block(("all",) + cache_key, history))
     else:
         st.caption("No items yet. Generate your first result on the right.")
 
@@ -141,12 +559,13 @@ st.caption("Build software, modify code, edit any text, speak to it, or ask anyt
 # -----------------------------
 # Tabs for modes
 # -----------------------------
-tab_build, tab_modify, tab_edit, tab_ask, tab_voice = st.tabs([
+tab_build, tab_modify, tab_edit, tab_ask, tab_voice, tab_batch = st.tabs([
     "🛠️ Build Code",
     "🧩 Modify Code",
     "✍️ Edit Anything",
     "💬 Ask Anything",
-    "🎙️ Voice"
+    "🎙️ Voice",
+    "📦 Batch Jobs"
 ])
 
 # -----------------------------
@@ -155,7 +574,7 @@ tab_build, tab_modify, tab_edit, tab_ask, tab_voice = st.tabs([
 with tab_build:
     col_left, col_right = st.columns([2, 1])
     with col_left:
-        default_prompt = template_text(template) if template != "— None —" else ""
+        default_prompt = _TEMPLATES.get(template, "")
         prompt = st.text_area(
             "Describe the software to build",
             height=180,
@@ -166,36 +585,46 @@ with tab_build:
         filename = st.text_input("File name", value="app.py", help="e.g., app.py, calculator.py")
         st.info("Tip: Files are saved in /projects with a timestamp.")
 
-    generate = st.button("Generate Code", type="primary")
+    btn_left, btn_right = st.columns([1, 1])
+    with btn_left:
+        generate = st.button("Generate Code", type="primary")
+    with btn_right:
+        generate_variants = st.button("Generate 3 Variants", help="Sample three takes on the same prompt in a single request.")
 
-    if generate:
+    # Validation uses plain guards rather than st.stop(): aborting the
+    # rerun would skip the other tabs' widgets and destabilize their
+    # state for the next interaction.
+    if generate_variants:
         if not prompt.strip():
             st.warning("Please describe what to build.")
-            st.stop()
-
-        with st.spinner("Generating clean code…"):
-            messages = [
-                {"role": "system", "content": "You are a helpful software engineer. Return only runnable code unless asked otherwise."},
-                {"role": "user", "content": prompt}
-            ]
-            code = ask_model(messages)
+        else:
+            with st.spinner("Generating 3 variants…"):
+                messages = [
+                    {"role": "system", "content": "You are a helpful software engineer. Return only runnable code unless asked otherwise."},
+                    {"role": "user", "content": prompt}
+                ]
+                variants = ask_model_nvariants(messages, n=3)
 
-        st.subheader("📝 Generated code")
-        st.code(code, language="python")
+            st.subheader("📝 Variants")
+            cols = st.columns(len(variants))
+            for i, (col, variant) in enumerate(zip(cols, variants), start=1):
+                with col:
+                    st.caption(f"Variant {i}")
+                    st.code(variant, language="python")
 
-        try:
-            path = save_text(code, filename)
-            st.success(f"✅ Code saved to {path}")
-            st.download_button("Download code file", code, file_name=os.path.basename(path))
-            st.session_state.history.append({
-                "mode": "Build Code",
-                "prompt": prompt,
-                "filename": filename,
-                "path": path,
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-        except Exception as e:
-            st.error(f"❌ Failed to save file: {str(e)}")
+    if generate:
+        if not prompt.strip():
+            st.warning("Please describe what to build.")
+        else:
+            run_llm_pipeline(
+                "Build Code",
+                "You are a helpful software engineer. Return only runnable code unless asked otherwise.",
+                prompt,
+                prompt,
+                filename,
+                result_label="📝 Generated code",
+                download_label="Download code file",
+            )
 
 # -----------------------------
 # Modify Code
@@ -220,36 +649,26 @@ with tab_modify:
     apply_changes = st.button("Apply Changes", type="primary")
 
     if apply_changes:
+        valid = True
         if not base_code.strip():
             st.warning("Please paste the code to modify.")
-            st.stop()
+            valid = False
         if not change_request.strip():
             st.warning("Please describe the changes you want.")
-            st.stop()
-
-        with st.spinner("Updating your code…"):
-            messages = [
-                {"role": "system", "content": "You are a senior software engineer. Transform the provided code according to the request. Return only the full updated code."},
-                {"role": "user", "content": f"Original code:\n\n{base_code}\n\nChange request:\n{change_request}"}
-            ]
-            updated = ask_model(messages)
-
-        st.subheader("📝 Updated code")
-        st.code(updated, language="python")
-
-        try:
-            path = save_text(updated, filename2)
-            st.success(f"✅ Updated code saved to {path}")
-            st.download_button("Download updated file", updated, file_name=os.path.basename(path))
-            st.session_state.history.append({
-                "mode": "Modify Code",
-                "prompt": change_request,
-                "filename": filename2,
-                "path": path,
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-        except Exception as e:
-            st.error(f"❌ Failed to save file: {str(e)}")
+            valid = False
+
+        if valid:
+            run_llm_pipeline(
+                "Modify Code",
+                "You are a senior software engineer. Transform the provided code according to the request. Return only the full updated code.",
+                f"Original code:\n\n{base_code}\n\nChange request:\n{change_request}",
+                change_request,
+                filename2,
+                result_label="📝 Updated code",
+                download_label="Download updated file",
+                chunk_blob=base_code,
+                chunk_user_fn=lambda chunk: f"Original code:\n\n{chunk}\n\nChange request:\n{change_request}",
+            )
 
 # -----------------------------
 # Edit Anything (text/doc/code)
@@ -274,36 +693,27 @@ with tab_edit:
     apply_edit = st.button("Apply Edit", type="primary")
 
     if apply_edit:
+        valid = True
         if not content.strip():
             st.warning("Please paste the content to edit.")
-            st.stop()
+            valid = False
         if not edit_request.strip():
             st.warning("Please describe the edit you want.")
-            st.stop()
-
-        with st.spinner("Editing…"):
-            messages = [
-                {"role": "system", "content": "You are a precise editor. Apply the requested changes faithfully. Return only the edited content."},
-                {"role": "user", "content": f"Content:\n\n{content}\n\nEdit request:\n{edit_request}"}
-            ]
-            edited = ask_model(messages)
-
-        st.subheader("📝 Edited content")
-        st.code(edited, language="text")
-
-        try:
-            path = save_text(edited, filename3)
-            st.success(f"✅ Edited content saved to {path}")
-            st.download_button("Download edited content", edited, file_name=os.path.basename(path))
-            st.session_state.history.append({
-                "mode": "Edit Anything",
-                "prompt": edit_request,
-                "filename": filename3,
-                "path": path,
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-        except Exception as e:
-            st.error(f"❌ Failed to save edited content: {str(e)}")
+            valid = False
+
+        if valid:
+            run_llm_pipeline(
+                "Edit Anything",
+                "You are a precise editor. Apply the requested changes faithfully. Return only the edited content.",
+                f"Content:\n\n{content}\n\nEdit request:\n{edit_request}",
+                edit_request,
+                filename3,
+                language="text",
+                result_label="📝 Edited content",
+                download_label="Download edited content",
+                chunk_blob=content,
+                chunk_user_fn=lambda chunk: f"Content:\n\n{chunk}\n\nEdit request:\n{edit_request}",
+            )
 
 # -----------------------------
 # Ask Anything
@@ -325,32 +735,19 @@ with tab_ask:
     if ask:
         if not question.strip():
             st.warning("Please enter your question.")
-            st.stop()
-
-        with st.spinner("Thinking…"):
-            messages = [
-                {"role": "system", "content": "You are a helpful, factual assistant. Provide clear, concise answers. If a calculation depends on live data, explain the method and give an approximate answer."},
-                {"role": "user", "content": question}
-            ]
-            answer = ask_model(messages, temperature=0.0)
-
-        st.subheader("🧠 Answer")
-        st.write(answer)
-
-        if filename4.strip():
-            try:
-                path = save_text(answer, filename4)
-                st.success(f"✅ Answer saved to {path}")
-                st.download_button("Download answer", answer, file_name=os.path.basename(path))
-                st.session_state.history.append({
-                    "mode": "Ask Anything",
-                    "prompt": question,
-                    "filename": filename4,
-                    "path": path,
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-            except Exception as e:
-                st.error(f"❌ Failed to save answer: {str(e)}")
+        else:
+            run_llm_pipeline(
+                "Ask Anything",
+                "You are a helpful, factual assistant. Provide clear, concise answers. If a calculation depends on live data, explain the method and give an approximate answer.",
+                question,
+                question,
+                filename4,
+                language=None,
+                temperature=0.0,
+                result_label="🧠 Answer",
+                download_label="Download answer",
+                save_optional=True,
+            )
 
 # -----------------------------
 # Voice (upload audio → transcribe)
@@ -361,22 +758,26 @@ with tab_voice:
     filename5 = st.text_input("Save transcript as", value="transcript.txt")
     process_audio = st.button("Transcribe & Answer", type="primary")
 
-    if process_audio:
-        if not audio_file:
-            st.warning("Please upload an audio file.")
-            st.stop()
+    if process_audio and not audio_file:
+        st.warning("Please upload an audio file.")
 
+    if process_audio and audio_file:
         with st.spinner("Transcribing…"):
             try:
-                temp_path = os.path.join(PROJECTS_DIR, f"temp_{audio_file.name}")
-                with open(temp_path, "wb") as f:
-                    f.write(audio_file.read())
-
-                audio = open(temp_path, "rb")
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio
-                ).text.strip()
+                # Hash the upload in 1 MiB chunks for the cache key, then
+                # hand the file-like straight to the API — no temp file,
+                # so the clip never touches disk at all.
+                hasher = hashlib.sha256()
+                audio_file.seek(0)
+                while chunk := audio_file.read(1 << 20):
+                    hasher.update(chunk)
+                digest = hasher.hexdigest()
+
+                audio_file.seek(0)
+                transcript = _cached_transcribe(
+                    digest,
+                    (audio_file.name, audio_file, audio_file.type or "audio/mpeg")
+                )
 
                 st.subheader("🗣️ Transcript")
                 st.write(transcript)
@@ -385,40 +786,84 @@ with tab_voice:
                     {"role": "system", "content": "You are a helpful assistant. Respond clearly and concisely to the user's transcribed voice request."},
                     {"role": "user", "content": transcript}
                 ]
-                reply = ask_model(messages, temperature=0.2)
-
                 st.subheader("💬 Response")
-                st.write(reply)
+                reply_out = st.empty()
+                reply = ask_model(messages, temperature=0.2, placeholder=reply_out, language=None)
+                reply_out.markdown(reply)
 
                 combined = f"Transcript:\n{transcript}\n\nResponse:\n{reply}"
-                path = save_text(combined, filename5)
+                now = datetime.now()
+                path = save_text(combined, filename5, now)
                 st.success(f"✅ Transcript & response saved to {path}")
                 st.download_button("Download transcript & response", combined, file_name=os.path.basename(path))
 
-                st.session_state.history.append({
+                append_history({
                     "mode": "Voice",
                     "prompt": transcript,
                     "filename": filename5,
                     "path": path,
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    "time": now.strftime("%Y-%m-%d %H:%M:%S")
                 })
 
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
+            except Exception as e:
+                st.error(f"❌ Voice processing failed: {e}")
 
+# -----------------------------
+# Batch Jobs (24h Batch API)
+# -----------------------------
+with tab_batch:
+    st.info("Batch jobs run within 24 hours at 50% of the synchronous price and use a separate rate-limit pool. Good for bulk re-runs that don't need an instant answer.")
+
+    if st.session_state.history:
+        if st.button("Re-run all history prompts as a batch", type="primary"):
+            messages_list = [
+                [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": item["prompt"]}
+                ]
+                for item in st.session_state.history
+            ]
+            custom_ids = [f"history-{i}" for i in range(len(messages_list))]
+            try:
+                batch_id = submit_batch(messages_list, custom_ids)
+                st.session_state.batches.append({
+                    "id": batch_id,
+                    "status": "submitted",
+                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "saved": False
+                })
+                st.success(f"✅ Batch submitted: {batch_id}")
             except Exception as e:
-                st.error(f"❌ Voice processing failed: {str(e)}")
+                st.error(f"❌ Batch submission failed: {e}")
+    else:
+        st.caption("No history prompts to submit yet. Generate something first.")
+
+    if st.session_state.batches:
+        st.markdown("### Submitted batches")
+        st.table([
+            {"Batch ID": job["id"], "Status": job["status"], "Submitted": job["time"]}
+            for job in st.session_state.batches
+        ])
+
+        if st.button("Poll status"):
+            for job in st.session_state.batches:
+                try:
+                    batch = client.batches.retrieve(job["id"])
+                    job["status"] = batch.status
+                    if batch.status == "completed" and not job["saved"] and batch.output_file_id:
+                        output = client.files.content(batch.output_file_id).text
+                        for line in output.splitlines():
+                            record = json.loads(line)
+                            body = record.get("response", {}).get("body", {})
+                            choices = body.get("choices") or []
+                            text = choices[0]["message"]["content"] if choices else ""
+                            save_text(text, f"{record.get('custom_id', 'batch_result')}.txt")
+                        job["saved"] = True
+                        st.success(f"✅ Batch {job['id']} completed — results saved to /projects.")
+                except Exception as e:
+                    st.error(f"❌ Failed to poll {job['id']}: {e}")
 
 # -----------------------------
 # Footer — polished buttons
 # -----------------------------
-st.markdown("""
-<div class="footer-bar">
-  <a class="footer-btn" href="#" target="_self">Home</a>
-  <a class="footer-btn" href="#" target="_self">Docs</a>
-  <a class="footer-btn" href="#" target="_self">Contact</a>
-  <span class="footer-note">Local app. When you’re ready, we’ll deploy to your domain: spyceofficial.com</span>
-</div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+_inject_html(_FOOTER_HTML)
\ No newline at end of file